@@ -1,13 +1,26 @@
 import sys
 import os
+import time
 import markdown
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QTextEdit, QAction, QFileDialog,
     QMessageBox, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel
 )
-from PyQt5.QtGui import QTextCursor, QFont, QTextCharFormat, QIcon, QColor, QPalette
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QTextCursor, QFont, QTextCharFormat, QIcon, QColor, QPalette, QKeySequence
+from PyQt5.QtCore import Qt, QSize, QEvent
 from PyQt5.QtPrintSupport import QPrintDialog, QPrinter
+from undo_history import UndoHistory, apply_change, parse_memory_limit, utf16_len
+
+UNDO_MEMORY_LIMIT = parse_memory_limit(os.environ.get("MDEDITOR_UNDO_LIMIT_MB"))
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
 
 class MarkdownEditor(QMainWindow):
     def __init__(self):
@@ -22,6 +35,10 @@ class MarkdownEditor(QMainWindow):
         # State
         self.current_file = None
         self.text_changed = False
+        self.history = UndoHistory(UNDO_MEMORY_LIMIT)
+        self.history_text = bytearray()  # UTF-16 mirror of the editor text, indexed like Qt positions
+        self.applying_history = False
+        self.preview_html_size = 0
 
         # Central Widget and Beautiful Layout
         widget = QWidget()
@@ -57,6 +74,10 @@ class MarkdownEditor(QMainWindow):
             QTextEdit:focus { border: 2px solid #18d6b4; }
         """)
         self.editor.setPlaceholderText("Escribe Markdown aquí…")
+        # Qt's built-in undo stack is unbounded; UndoHistory replaces it
+        self.editor.setUndoRedoEnabled(False)
+        self.editor.installEventFilter(self)
+        self.editor.viewport().installEventFilter(self)
         main_row.addWidget(self.editor, 3)
 
         # Preview area
@@ -122,6 +143,10 @@ class MarkdownEditor(QMainWindow):
         self.btn_about.setStyleSheet(BUTTON_STYLE)
         tools_bar.addWidget(self.btn_about)
 
+        self.btn_memory = QPushButton("📊 Memoria")
+        self.btn_memory.setStyleSheet(BUTTON_STYLE)
+        tools_bar.addWidget(self.btn_memory)
+
         tools_bar.addStretch(1)
 
         # Toggle Preview Button (OK to keep its style as it's legal CSS)
@@ -159,8 +184,10 @@ class MarkdownEditor(QMainWindow):
         self.btn_save_as.clicked.connect(self.save_as_file)
         self.btn_print.clicked.connect(self.print_file)
         self.btn_about.clicked.connect(self.about)
+        self.btn_memory.clicked.connect(self.show_memory_report)
         self.btn_toggle_preview.toggled.connect(self.toggle_preview)
 
+        self.editor.document().contentsChange.connect(self.record_edit)
         self.editor.textChanged.connect(self.update_preview)
         self.editor.textChanged.connect(self.update_word_count)
         self.editor.textChanged.connect(self.set_text_changed)
@@ -209,8 +236,11 @@ class MarkdownEditor(QMainWindow):
                 th, td { border: 1px solid #18d6b4; padding: 7px 15px; color: #dff2eb; }
                 </style>
             """
-            self.preview.setHtml(beautiful_css + "<body>" + html + "</body>")
+            preview_html = beautiful_css + "<body>" + html + "</body>"
+            self.preview_html_size = sys.getsizeof(preview_html)
+            self.preview.setHtml(preview_html)
         else:
+            self.preview_html_size = 0
             self.preview.clear()
 
     def set_text_changed(self):
@@ -223,6 +253,130 @@ class MarkdownEditor(QMainWindow):
         if checked:
             self.update_preview()
 
+    # --- Undo History ---
+    def document_text(self, start, end):
+        # selectedText() keeps NBSP and U+2028 as-is; only paragraph breaks need mapping
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        return cursor.selectedText().replace("\u2029", "\n")
+
+    def record_edit(self, pos, chars_removed, chars_added):
+        if self.applying_history:
+            return
+        # Qt may report the trailing block separator too, so clamp to the real text
+        length = self.editor.document().characterCount() - 1
+        inserted = self.document_text(min(pos, length), min(pos + chars_added, length))
+        try:
+            op = apply_change(self.history_text, pos, chars_removed, inserted, length, time.monotonic())
+        except ValueError:
+            # The mirror drifted from the document: resync rather than keep a corrupt delta chain
+            self.reset_history()
+            return
+        if op:
+            self.history.record(op)
+
+    def reset_history(self):
+        self.history.clear()
+        text = self.document_text(0, self.editor.document().characterCount() - 1)
+        self.history_text = bytearray(text.encode("utf-16-le", "surrogatepass"))
+
+    def replace_document(self, text):
+        # Loading a document is not an undoable edit: skip recording, then start a fresh history
+        self.applying_history = True
+        try:
+            self.editor.setPlainText(text)
+        finally:
+            self.applying_history = False
+        self.reset_history()
+
+    def apply_edit(self, pos, removed, inserted):
+        end = pos + utf16_len(removed)
+        cursor = self.editor.textCursor()
+        cursor.setPosition(pos)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.applying_history = True
+        try:
+            cursor.insertText(inserted)
+        finally:
+            self.applying_history = False
+        self.history_text[pos * 2:end * 2] = inserted.encode("utf-16-le", "surrogatepass")
+        self.editor.setTextCursor(cursor)
+
+    def undo(self):
+        op = self.history.undo()
+        if op:
+            self.apply_edit(op.pos, op.inserted, op.removed)
+
+    def redo(self):
+        op = self.history.redo()
+        if op:
+            self.apply_edit(op.pos, op.removed, op.inserted)
+
+    def show_editor_menu(self, obj, event):
+        # Qt's own Deshacer/Rehacer entries stay disabled, so point them at UndoHistory
+        pos = event.pos() if obj is self.editor.viewport() else self.editor.viewport().mapFrom(self.editor, event.pos())
+        # Like QTextEdit.contextMenuEvent: the menu position is in document coordinates
+        pos.setX(pos.x() + self.editor.horizontalScrollBar().value())
+        pos.setY(pos.y() + self.editor.verticalScrollBar().value())
+        menu = self.editor.createStandardContextMenu(pos)
+        for name, slot, stack in (("edit-undo", self.undo, self.history.undo_stack),
+                                  ("edit-redo", self.redo, self.history.redo_stack)):
+            for old in menu.actions():
+                if old.objectName() == name:
+                    action = QAction(old.icon(), old.text(), menu)
+                    action.setShortcut(old.shortcut())
+                    action.setEnabled(bool(stack))
+                    action.triggered.connect(slot)
+                    menu.insertAction(old, action)
+                    menu.removeAction(old)
+        menu.exec_(event.globalPos())
+        menu.deleteLater()
+
+    def eventFilter(self, obj, event):
+        if obj in (self.editor, self.editor.viewport()) and event.type() == QEvent.ContextMenu:
+            self.show_editor_menu(obj, event)
+            return True
+        if obj is self.editor and event.type() in (QEvent.ShortcutOverride, QEvent.KeyPress):
+            if event.matches(QKeySequence.Undo) or event.matches(QKeySequence.Redo):
+                if event.type() == QEvent.KeyPress:
+                    if event.matches(QKeySequence.Undo):
+                        self.undo()
+                    else:
+                        self.redo()
+                event.accept()
+                return True
+        return super().eventFilter(obj, event)
+
+    # --- Memory Report ---
+    def memory_report(self):
+        # Approximate text sizes in bytes; Qt stores document text as UTF-16 and
+        # layout/format data for both documents comes on top of these figures
+        return {
+            "document": self.editor.document().characterCount() * 2,
+            "undo": self.history.memory,
+            "cache_history_mirror": sys.getsizeof(self.history_text),
+            "cache_preview_document": self.preview.document().characterCount() * 2,
+            "preview_html": self.preview_html_size,
+        }
+
+    def show_memory_report(self):
+        report = self.memory_report()
+        caches = report["cache_history_mirror"] + report["cache_preview_document"]
+        # The rendered HTML is not kept, so it only counts as a peak while rendering
+        resident = report["document"] + report["undo"] + caches
+        QMessageBox.information(
+            self, "Uso de memoria",
+            f"<p><b>Documento (texto):</b> {format_bytes(report['document'])}</p>"
+            f"<p><b>Historial de deshacer:</b> {format_bytes(report['undo'])} "
+            f"({len(self.history.undo_stack)} pasos, límite {format_bytes(self.history.memory_limit)})</p>"
+            f"<p><b>Cachés:</b> {format_bytes(caches)} "
+            f"(copia espejo del historial {format_bytes(report['cache_history_mirror'])}, "
+            f"vista previa {format_bytes(report['cache_preview_document'])})</p>"
+            f"<p><b>Total aprox.:</b> {format_bytes(resident)}</p>"
+            f"<p><b>HTML de vista previa (pico al renderizar):</b> {format_bytes(report['preview_html'])}</p>"
+        )
+
     # --- File Actions ---
     def new_file(self):
         if self.text_changed:
@@ -235,7 +389,7 @@ class MarkdownEditor(QMainWindow):
                 self.save_file()
             elif reply == QMessageBox.Cancel:
                 return
-        self.editor.clear()
+        self.replace_document("")
         self.current_file = None
         self.text_changed = False
         self.update_title()
@@ -259,7 +413,7 @@ class MarkdownEditor(QMainWindow):
         if file_path:
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
-                    self.editor.setPlainText(f.read())
+                    self.replace_document(f.read())
                 self.current_file = file_path
                 self.text_changed = False
                 self.update_title()
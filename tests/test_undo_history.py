@@ -0,0 +1,147 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from undo_history import EditOp, UndoHistory, apply_change, parse_memory_limit, UNDO_MIN_LIMIT_MB
+
+
+def apply(text, pos, removed, inserted):
+    assert text[pos:pos + len(removed)] == removed
+    return text[:pos] + inserted + text[pos + len(removed):]
+
+
+def recomputed_memory(history):
+    return sum(op.size() for op in history.undo_stack) + sum(op.size() for op in history.redo_stack)
+
+
+class ParseMemoryLimitTest(unittest.TestCase):
+    def test_valid_value(self):
+        self.assertEqual(parse_memory_limit("2"), 2 * 1024 * 1024)
+
+    def test_bad_values_fall_back_to_default(self):
+        for value in ("16MB", "", None, "inf", "nan"):
+            self.assertEqual(parse_memory_limit(value, default_mb=4), 4 * 1024 * 1024)
+
+    def test_non_positive_values_are_clamped(self):
+        for value in ("0", "-3"):
+            self.assertEqual(parse_memory_limit(value), UNDO_MIN_LIMIT_MB * 1024 * 1024)
+
+
+class MergeTest(unittest.TestCase):
+    def test_typing_merges_one_op_per_word(self):
+        history = UndoHistory()
+        for i, char in enumerate("hello world"):
+            history.record(EditOp(i, "", char, 0))
+        self.assertEqual([op.inserted for op in history.undo_stack], ["hello", " world"])
+
+    def test_backspace_and_delete_merge(self):
+        history = UndoHistory()
+        history.record(EditOp(4, "o", "", 0))
+        history.record(EditOp(3, "l", "", 0))
+        history.record(EditOp(3, "x", "", 0))
+        self.assertEqual([(op.pos, op.removed) for op in history.undo_stack], [(3, "lox")])
+
+    def test_paste_does_not_merge_with_typing(self):
+        history = UndoHistory()
+        history.record(EditOp(0, "", "a", 0))
+        history.record(EditOp(1, "", "bc", 0))
+        history.record(EditOp(3, "", "d", 0))
+        self.assertEqual([op.inserted for op in history.undo_stack], ["a", "bc", "d"])
+
+    def test_pause_starts_new_op(self):
+        history = UndoHistory()
+        history.record(EditOp(0, "", "a", 0))
+        history.record(EditOp(1, "", "b", 5))
+        self.assertEqual(len(history.undo_stack), 2)
+
+
+class EvictionTest(unittest.TestCase):
+    def test_oldest_ops_are_evicted_first(self):
+        history = UndoHistory(memory_limit=600)
+        for i in range(20):
+            history.record(EditOp(0, "", "line %d\n" % i + "x" * 50, i * 10))
+        self.assertLessEqual(history.memory, 600)
+        self.assertTrue(history.undo_stack)
+        self.assertTrue(history.undo_stack[-1].inserted.startswith("line 19"))
+        self.assertEqual(history.memory, recomputed_memory(history))
+
+    def test_op_larger_than_cap_is_kept(self):
+        history = UndoHistory(memory_limit=1024 * 1024)
+        for i, char in enumerate("one two three four five six"):
+            history.record(EditOp(i, "", char, 0))
+        paste = EditOp(27, "", "x" * (2 * 1024 * 1024), 10)
+        history.record(paste)
+        self.assertEqual(list(history.undo_stack), [paste])
+        self.assertEqual(history.memory, paste.size())
+        self.assertIs(history.undo(), paste)
+
+
+def mirror(text):
+    return bytearray(text.encode("utf-16-le", "surrogatepass"))
+
+
+class ApplyChangeTest(unittest.TestCase):
+    def test_first_keystroke_range_includes_block_separator(self):
+        # Qt reports removed=1/added=2 on an empty document; the caller clamps the text
+        text = mirror("")
+        op = apply_change(text, 0, 1, "a", 1, 0)
+        self.assertEqual((op.pos, op.removed, op.inserted), (0, "", "a"))
+        self.assertEqual(text, mirror("a"))
+
+    def test_format_only_change_records_nothing(self):
+        text = mirror("hello")
+        self.assertIsNone(apply_change(text, 0, 5, "hello", 5, 0))
+        self.assertEqual(text, mirror("hello"))
+
+    def test_unchanged_edges_are_trimmed(self):
+        text = mirror("hello world")
+        op = apply_change(text, 0, 11, "hello there world", 17, 0)
+        self.assertEqual((op.pos, op.removed, op.inserted), (6, "", "there "))
+        self.assertEqual(text, mirror("hello there world"))
+
+    def test_surrogate_pairs_use_utf16_positions(self):
+        text = mirror("a\U0001F600b")
+        op = apply_change(text, 1, 2, "", 2, 0)
+        self.assertEqual((op.pos, op.removed, op.inserted), (1, "\U0001F600", ""))
+        self.assertEqual(text, mirror("ab"))
+        text = mirror("\U0001F600\U0001F600")
+        op = apply_change(text, 0, 4, "\U0001F600x\U0001F600", 5, 0)
+        self.assertEqual((op.pos, op.removed, op.inserted), (2, "", "x"))
+
+    def test_drift_raises(self):
+        text = mirror("abc")
+        with self.assertRaises(ValueError):
+            apply_change(text, 1, 1, "xy", 3, 0)
+
+
+class RoundTripTest(unittest.TestCase):
+    def test_random_edits_round_trip(self):
+        rng = random.Random(26)
+        original = text = "".join(rng.choice("ab \n") for _ in range(200))
+        history = UndoHistory()
+        for step in range(500):
+            pos = rng.randrange(len(text) + 1)
+            removed = text[pos:pos + rng.choice((0, 0, 1, 3))]
+            inserted = rng.choice(("", "x", " ", "yz"))
+            if not removed and not inserted:
+                continue
+            history.record(EditOp(pos, removed, inserted, step * 0.1))
+            text = apply(text, pos, removed, inserted)
+            self.assertEqual(history.memory, recomputed_memory(history))
+        final = text
+        while history.undo_stack:
+            op = history.undo()
+            text = apply(text, op.pos, op.inserted, op.removed)
+        self.assertEqual(text, original)
+        while history.redo_stack:
+            op = history.redo()
+            text = apply(text, op.pos, op.removed, op.inserted)
+        self.assertEqual(text, final)
+        self.assertEqual(history.memory, recomputed_memory(history))
+
+
+if __name__ == "__main__":
+    unittest.main()
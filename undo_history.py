@@ -0,0 +1,157 @@
+import sys
+from collections import deque
+
+# Undo history tuning (the memory cap can be overridden for low-RAM machines)
+UNDO_DEFAULT_LIMIT_MB = 16
+UNDO_MIN_LIMIT_MB = 1
+UNDO_MERGE_INTERVAL = 1.0  # seconds between keystrokes that still merge into one op
+
+
+def parse_memory_limit(value, default_mb=UNDO_DEFAULT_LIMIT_MB):
+    # Bad values fall back to the default instead of stopping the editor from starting
+    try:
+        megabytes = float(value)
+        limit = int(max(megabytes, UNDO_MIN_LIMIT_MB) * 1024 * 1024)
+    except (TypeError, ValueError, OverflowError):
+        limit = int(default_mb * 1024 * 1024)
+    return limit
+
+
+def utf16_len(text):
+    # Qt document positions count UTF-16 code units, not Python code points
+    return len(text.encode("utf-16-le", "surrogatepass")) // 2
+
+
+def common_prefix_len(a, b):
+    # Binary search over slice comparisons, so the scan itself runs in C
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix_len(a, b, limit):
+    lo, hi = 0, min(len(a), len(b), limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class EditOp:
+    # A single delta: at `pos` (UTF-16 units), `removed` was replaced by `inserted`
+    __slots__ = ("pos", "removed", "inserted", "stamp", "typed")
+
+    def __init__(self, pos, removed, inserted, stamp):
+        self.pos = pos
+        self.removed = removed
+        self.inserted = inserted
+        self.stamp = stamp
+        # Only single keystrokes (one typed or deleted character) may merge
+        self.typed = (not removed and len(inserted) == 1) or (not inserted and len(removed) == 1)
+
+    def size(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.removed) + sys.getsizeof(self.inserted)
+
+    def merge(self, other):
+        # Fold consecutive typing / backspacing / deleting into one op per word
+        if not (self.typed and other.typed) or other.stamp - self.stamp > UNDO_MERGE_INTERVAL:
+            return False
+        if not self.removed and not other.removed:
+            if other.inserted == "\n" or other.pos != self.pos + utf16_len(self.inserted):
+                return False
+            if other.inserted.isspace() and not self.inserted[-1:].isspace():
+                return False  # start a new op at each word boundary
+            self.inserted += other.inserted
+        elif not self.inserted and not other.inserted:
+            if other.removed == "\n":
+                return False
+            if other.pos + utf16_len(other.removed) == self.pos:  # backspace
+                self.removed = other.removed + self.removed
+                self.pos = other.pos
+            elif other.pos == self.pos:  # forward delete
+                self.removed += other.removed
+            else:
+                return False
+        else:
+            return False
+        self.stamp = other.stamp
+        return True
+
+
+class UndoHistory:
+    def __init__(self, memory_limit=UNDO_DEFAULT_LIMIT_MB * 1024 * 1024):
+        self.memory_limit = memory_limit
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.memory = 0
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.memory = 0
+
+    def record(self, op):
+        self.memory -= sum(o.size() for o in self.redo_stack)
+        self.redo_stack.clear()
+        if self.undo_stack:
+            last = self.undo_stack[-1]
+            before = last.size()
+            if last.merge(op):
+                self.memory += last.size() - before
+                self.evict()
+                return
+        self.undo_stack.append(op)
+        self.memory += op.size()
+        self.evict()
+
+    def evict(self):
+        # Drop the oldest undo ops first, then the farthest redo ops; the newest
+        # op is always kept, even when it alone exceeds the cap
+        while self.memory > self.memory_limit and len(self.undo_stack) > 1:
+            self.memory -= self.undo_stack.popleft().size()
+        while self.memory > self.memory_limit and self.redo_stack:
+            self.memory -= self.redo_stack.popleft().size()
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        op = self.undo_stack.pop()
+        self.redo_stack.append(op)
+        return op
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        op = self.redo_stack.pop()
+        self.undo_stack.append(op)
+        return op
+
+
+def apply_change(mirror, pos, removed_count, inserted, length, stamp):
+    # Splice a document change into `mirror` (UTF-16-LE bytes, indexed like Qt
+    # positions) and return the matching EditOp, or None if the text is unchanged.
+    # `inserted` is the text now in the reported range, already clamped to the
+    # document; `length` is the document length afterwards. Raises ValueError
+    # when the mirror no longer matches the document, leaving it to be rebuilt.
+    start, end = pos * 2, (pos + removed_count) * 2
+    removed = bytes(mirror[start:end]).decode("utf-16-le", "surrogatepass")
+    mirror[start:end] = inserted.encode("utf-16-le", "surrogatepass")
+    if len(mirror) // 2 != length:
+        raise ValueError("undo mirror is out of sync with the document")
+    # Trim the unchanged edges Qt sometimes includes in the reported range
+    prefix = common_prefix_len(removed, inserted)
+    suffix = common_suffix_len(removed, inserted, min(len(removed), len(inserted)) - prefix)
+    shift = utf16_len(removed[:prefix])
+    removed = removed[prefix:len(removed) - suffix]
+    inserted = inserted[prefix:len(inserted) - suffix]
+    if not removed and not inserted:
+        return None
+    return EditOp(pos + shift, removed, inserted, stamp)